@@ -1,4 +1,5 @@
 import gzip
+import hashlib
 import json
 import os
 import traceback
@@ -73,6 +74,29 @@ def get_event_payload(associate_oid, item_id, string_value):
     return payload
 
 
+def get_record_fingerprint(record):
+    return hashlib.sha256(
+        json.dumps(record, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def load_import_state(state_file):
+    if not os.path.exists(state_file):
+        return {}
+
+    with open(state_file, "r") as f:
+        return json.load(f)
+
+
+def save_import_state(state_file, import_state):
+    tmp_file = f"{state_file}.tmp"
+
+    with open(tmp_file, "w") as f:
+        json.dump(import_state, f)
+
+    os.replace(tmp_file, state_file)
+
+
 def main():
     worker_endpoint = "/events/hr/v1/worker"
 
@@ -90,30 +114,56 @@ def main():
         import_data = json.load(f)
     print("\tSUCCESS!")
 
+    # fingerprints of import records applied on the last run, keyed by associate_oid
+    import_state_file = os.getenv(
+        "ADP_IMPORT_STATE_FILE", f"{os.getenv('ADP_IMPORT_FILE')}.state.json"
+    )
+    full_reconcile = os.getenv("ADP_FULL_RECONCILE", "").lower() in ["1", "true"]
+
+    if full_reconcile:
+        print("Full reconcile requested, ignoring previous import state...")
+        import_state = {}
+    else:
+        print("Loading previous import state...")
+        import_state = load_import_state(import_state_file)
+        print("\tSUCCESS!")
+
+    new_import_state = {}
+    changed_import_data = []
+    for i in import_data:
+        fingerprint = get_record_fingerprint(i)
+
+        if import_state.get(i["associate_oid"]) == fingerprint:
+            new_import_state[i["associate_oid"]] = fingerprint
+        else:
+            changed_import_data.append((i, fingerprint))
+
+    print(f"\t{len(changed_import_data)} of {len(import_data)} records changed")
+
+    if not changed_import_data:
+        save_import_state(import_state_file, new_import_state)
+        print("SUCCESS!")
+        return
+
     print("Loading ADP export data...")
     with gzip.open(os.getenv("ADP_EXPORT_FILE"), "r") as f:
         workers_export_data = json.loads(f.read().decode("utf-8"))
     print("\tSUCCESS!")
 
     print("Flattening ADP export data...")
-    workers_export_flat = [w for w in map(flatten_worker, workers_export_data)]
+    workers_export_flat = {
+        w["associateOID"]: w for w in map(flatten_worker, workers_export_data)
+    }
     print("\tSUCCESS!")
 
     print("Processing ADP updates...")
-    for i in import_data:
+    for i, fingerprint in changed_import_data:
         # match db record to ADP record
-        record_match = next(
-            iter(
-                [
-                    w
-                    for w in workers_export_flat
-                    if w["associateOID"] == i["associate_oid"]
-                ]
-            ),
-            None,
-        )
+        record_match = workers_export_flat.get(i["associate_oid"])
 
         if record_match:
+            apply_failed = False
+
             # update work email if new
             if i["mail"] != record_match.get("work_email").get("emailUri"):
                 print(
@@ -137,6 +187,7 @@ def main():
                         payload={"events": [work_email_data]},
                     )
                 except Exception as xc:
+                    apply_failed = True
                     print(xc)
                     print(traceback.format_exc())
                     email.send_email(
@@ -172,6 +223,7 @@ def main():
                         payload={"events": [emp_num_data]},
                     )
                 except Exception as xc:
+                    apply_failed = True
                     print(xc)
                     print(traceback.format_exc())
                     email.send_email(
@@ -207,6 +259,7 @@ def main():
                         payload={"events": [wfm_badge_data]},
                     )
                 except Exception as xc:
+                    apply_failed = True
                     print(xc)
                     print(traceback.format_exc())
                     email.send_email(
@@ -242,6 +295,7 @@ def main():
                         payload={"events": [wfm_trigger_data]},
                     )
                 except Exception as xc:
+                    apply_failed = True
                     print(xc)
                     print(traceback.format_exc())
                     email.send_email(
@@ -253,6 +307,14 @@ def main():
                         ),
                     )
 
+            # only record as applied if every update succeeded, so failures retry
+            if not apply_failed:
+                new_import_state[i["associate_oid"]] = fingerprint
+
+    print("Saving import state...")
+    save_import_state(import_state_file, new_import_state)
+    print("\tSUCCESS!")
+
     print("SUCCESS!")
 
 